@@ -27,7 +27,8 @@
 Various functions that are missing from the default Python library.
 
   - nub(list): keep the unique elements in the list
-  - nub_by(list, predicate): keep the unique elements (first come, first served) that do not satisfy a given predicate
+  - nub_by(list, predicate, key): keep the unique elements (first come, first served) that do not satisfy a given
+    predicate, or that have a unique key
   - find_sublist_index(list, sublist): find the index of the first
     occurence of the sublist in the list
   - Monoid: implementation of the monoid concept
@@ -42,9 +43,10 @@ Various functions that are missing from the default Python library.
 import logging
 import shlex
 import time
+from array import array
 from collections import namedtuple
-from functools import reduce
 from collections.abc import Mapping
+from functools import lru_cache
 
 
 from vsc.utils.frozendict import FrozenDict
@@ -69,34 +71,97 @@ def nub(list_):
     return [x for x in list_ if x not in seen and not seen_add(x)]
 
 
-def nub_by(list_, predicate):
+def nub_by(list_, predicate=None, key=None):
     """Returns the elements of a list that fullfil the predicate.
 
     For any pair of elements in the resulting list, the predicate does not hold. For example, the nub above
     can be expressed as nub_by(list, lambda x, y: x == y).
 
+    If the predicate is an equivalence derived from a key function, pass that function as key instead,
+    e.g., nub_by(list, key=str.lower). This uses a set of the keys seen so far and runs in linear time,
+    while the predicate version compares each element against all retained elements (quadratic).
+
     @type list_: a list of items of some type t
     @type predicate: a function that takes two elements of type t and returns a bool
+    @type key: a function that takes an element of type t and returns a hashable value
 
     @returns: the nubbed list
     """
+    if predicate is not None and key is not None:
+        raise TypeError("nub_by requires either a predicate or a key function, not both")
+
+    if key is not None:
+        seen_keys = set()
+        seen_keys_add = seen_keys.add
+        res = []
+        for x in list_:
+            k = key(x)
+            if k not in seen_keys:
+                seen_keys_add(k)
+                res.append(x)
+        return res
+
+    if predicate is None:
+        raise TypeError("nub_by requires either a predicate or a key function")
+
     seen = set()
     seen_add = seen.add
-    return [x for x in list_ if not any([predicate(x, y) for y in seen]) and not seen_add(x)]
+    return [x for x in list_ if not any(predicate(x, y) for y in seen) and not seen_add(x)]
 
 
 def find_sublist_index(ls, sub_ls):
     """Find the index at which the sublist sub_ls can be found in ls.
 
+    Lists of integers (that fit in 64 bits) are searched as bytes, other lists are searched
+    using the Knuth-Morris-Pratt algorithm, so only equality between elements is required.
+
     @type ls: list
     @type sub_ls: list
 
     @return: index of the matching location or None if no match can be made.
     """
+    if not ls:
+        return None
+
     sub_length = len(sub_ls)
-    for i in range(len(ls)):
-        if ls[i:(i + sub_length)] == sub_ls:
-            return i
+    if not sub_length:
+        return 0
+
+    # fast path: let bytes.find do the search if all elements are integers that fit in a byte or in 64 bits
+    for typecode in ('B', 'q'):
+        try:
+            packed_ls = array(typecode, ls).tobytes()
+            packed_sub_ls = array(typecode, sub_ls).tobytes()
+        except (TypeError, OverflowError):
+            continue
+
+        itemsize = array(typecode).itemsize
+        idx = packed_ls.find(packed_sub_ls)
+        # only matches that are aligned with the start of an element count
+        while idx > 0 and idx % itemsize:
+            idx = packed_ls.find(packed_sub_ls, idx + 1)
+        if idx < 0:
+            return None
+        return idx // itemsize
+
+    # failure table: length of the longest proper prefix of sub_ls[:i + 1] that is also a suffix of it
+    failure = [0] * sub_length
+    k = 0
+    for i in range(1, sub_length):
+        while k > 0 and sub_ls[i] != sub_ls[k]:
+            k = failure[k - 1]
+        if sub_ls[i] == sub_ls[k]:
+            k += 1
+        failure[i] = k
+
+    k = 0
+    for i, x in enumerate(ls):
+        while k > 0 and x != sub_ls[k]:
+            k = failure[k - 1]
+        if x == sub_ls[k]:
+            k += 1
+            if k == sub_length:
+                return i - sub_length + 1
 
     return None
 
@@ -122,12 +187,12 @@ class Monoid:
         """fold over the elements of the list, combining them into a single element of the target datatype."""
         if hasattr(xs, "__fold__"):
             return xs.__fold__(self)
-        else:
-            return reduce(
-                self.mappend,
-                xs,
-                self.null
-            )
+
+        acc = self.null
+        mappend = self.mappend
+        for x in xs:
+            acc = mappend(acc, x)
+        return acc
 
     def __call__(self, *args):
         """When the monoid is called, the values are folded over and the resulting value is returned."""
@@ -138,6 +203,10 @@ class Monoid:
         return Monoid(self.null, self.mappend)
 
 
+# marker for missing values, to distinguish from None values
+_MISSING = object()
+
+
 class MonoidDict(dict):
     """A dictionary with a monoid operation, that allows combining values in the dictionary according to the mappend
     operation in the monoid.
@@ -153,20 +222,18 @@ class MonoidDict(dict):
 
     def __setitem__(self, key, value):
         """Combine the value the dict has for the key with the new value using the mappend operation."""
-        if super().__contains__(key):
-            current = super().__getitem__(key)
-            super().__setitem__(key, self.monoid(current, value))
+        # single lookup via dict.get, rather than checking for the key and getting the value separately
+        current = dict.get(self, key, _MISSING)
+        if current is _MISSING:
+            dict.__setitem__(self, key, value)
         else:
-            super().__setitem__(key, value)
+            dict.__setitem__(self, key, self.monoid.mappend(current, value))
 
     def __getitem__(self, key):
         """ Obtain the dictionary value for the given key. If no value is present,
         we return the monoid's mempty (null).
         """
-        if not super().__contains__(key):
-            return self.monoid.null
-        else:
-            return super().__getitem__(key)
+        return dict.get(self, key, self.monoid.null)
 
 
 class RUDict(dict):
@@ -179,27 +246,46 @@ class RUDict(dict):
     """
 
     def update(self, E=None, **F):
+        self._update(E, F, {})
+
+    def _update(self, E, F, memo):
+        """Update with E and F, passing down memo of merged subtrees (see _r_update)."""
         if E is not None:
             if 'keys' in dir(E) and callable(getattr(E, 'keys')):
                 for k in E:
                     if k in self:  # existing ...must recurse into both sides
-                        self.r_update(k, E)
+                        self._r_update(k, E, memo)
                     else:  # doesn't currently exist, just update
                         self[k] = E[k]
             else:
                 for (k, v) in E:
-                    self.r_update(k, {k: v})
+                    self._r_update(k, {k: v}, memo)
 
         for k, v in F.items():
-            self.r_update(k, {k: v})
+            self._r_update(k, {k: v}, memo)
 
     def r_update(self, key, other_dict):
         """Recursive update."""
+        self._r_update(key, other_dict, {})
+
+    def _r_update(self, key, other_dict, memo):
+        """Recursive update.
+
+        memo maps the ids of (current, new) pairs of dicts that were already merged onto the result,
+        so subtrees that are shared by reference are only merged once (and remain shared).
+        """
         if isinstance(self[key], dict) and isinstance(other_dict[key], dict):
-            od = RUDict(self[key])
+            cd = self[key]
             nd = other_dict[key]
-            od.update(nd)
-            self[key] = od
+            memo_key = (id(cd), id(nd))
+            if memo_key in memo:
+                self[key] = memo[memo_key][0]
+            else:
+                od = RUDict(cd)
+                od._update(nd, {}, memo)
+                self[key] = od
+                # also keep the merged dicts around, to make sure their ids are not reused
+                memo[memo_key] = (od, cd, nd)
         elif isinstance(self[key], list):
             if isinstance(other_dict[key], list):
                 self[key].extend(other_dict[key])
@@ -214,6 +300,13 @@ class FrozenDictKnownKeys(FrozenDict):
 
     # list of known keys
     KNOWN_KEYS = []
+    # set of known keys, for fast lookups (derived from KNOWN_KEYS when a subclass is defined)
+    _KNOWN_KEYS_SET = frozenset(KNOWN_KEYS)
+
+    def __init_subclass__(cls, **kwargs):
+        """Derive set of known keys from (possibly redefined) KNOWN_KEYS list."""
+        super().__init_subclass__(**kwargs)
+        cls._KNOWN_KEYS_SET = frozenset(cls.KNOWN_KEYS)
 
     def __init__(self, *args, **kwargs):
         """Constructor, only way to define the contents."""
@@ -222,7 +315,8 @@ class FrozenDictKnownKeys(FrozenDict):
 
         # handle unknown keys: either ignore them or raise an exception
         tmpdict = dict(*args, **kwargs)
-        unknown_keys = [key for key in tmpdict if key not in self.KNOWN_KEYS]
+        known_keys = self._KNOWN_KEYS_SET
+        unknown_keys = [key for key in tmpdict if key not in known_keys]
         if unknown_keys:
             if ignore_unknown_keys:
                 for key in unknown_keys:
@@ -240,16 +334,22 @@ class FrozenDictKnownKeys(FrozenDict):
         try:
             return super().__getitem__(key, *args, **kwargs)
         except KeyError as err:
-            if key in self.KNOWN_KEYS:
+            if key in self._KNOWN_KEYS_SET:
                 raise KeyError(err)
             else:
                 raise KeyError(
                     f"Unknown key '{key}' for {self.__class__.__name__} instance (known keys: { self.KNOWN_KEYS})")
 
 
+@lru_cache(maxsize=256)
+def _shell_quote_str(x):
+    """Cached shlex.quote, the same arguments tend to get quoted over and over when composing command lines"""
+    return shlex.quote(x)
+
+
 def shell_quote(x):
     """Add quotes so it can be passed to shell"""
-    return shlex.quote(str(x))
+    return _shell_quote_str(str(x))
 
 
 def shell_unquote(x):
@@ -292,7 +392,21 @@ def get_subclasses_dict(klass, include_base_class=False):
 
 def get_subclasses(klass, include_base_class=False):
     """Get list of all subclasses, recursively from the specified base class."""
-    return get_subclasses_dict(klass, include_base_class=include_base_class).keys()
+    res = []
+    seen = set()
+    if include_base_class:
+        stack = [klass]
+    else:
+        stack = list(reversed(klass.__subclasses__()))
+    # depth-first walk (same order as get_subclasses_dict), each class is only visited once
+    while stack:
+        subclass = stack.pop()
+        if subclass in seen:
+            continue
+        seen.add(subclass)
+        res.append(subclass)
+        stack.extend(reversed(subclass.__subclasses__()))
+    return res
 
 
 class TryOrFail:
@@ -306,17 +420,20 @@ class TryOrFail:
         self.sleep = sleep
 
     def __call__(self, function):
+        # resolve settings once when decorating, rather than on every attempt
+        n, exceptions, sleep = self.n, self.exceptions, self.sleep
+
         def new_function(*args, **kwargs):
-            for i in range(0, self.n):
+            for i in range(0, n):
                 try:
                     return function(*args, **kwargs)
-                except self.exceptions as err:
-                    if i == self.n - 1:
+                except exceptions as err:
+                    if i == n - 1:
                         raise
                     logging.exception("try_or_fail caught an exception - attempt %d: %s", i, err)
-                    if self.sleep > 0:
-                        logging.warning("try_or_fail is sleeping for %d seconds before the next attempt", self.sleep)
-                        time.sleep(self.sleep)
+                    if sleep > 0:
+                        logging.warning("try_or_fail is sleeping for %d seconds before the next attempt", sleep)
+                        time.sleep(sleep)
 
                 return None
 
@@ -39,11 +39,82 @@ import base64
 import copy
 import json
 import logging
-from functools import partial
+import ssl
+from functools import lru_cache, partial
 from urllib.parse import urlencode
 from urllib.request import Request, HTTPSHandler, build_opener
 
 CENSORED_MESSAGE = '<actual secret censored>'
+# keys in headers and body of requests that are censored in logs, to avoid leaking tokens or passwords
+SECRET_HEADERS = frozenset(['Authorization', 'X-Auth-Token'])
+SECRET_BODY_KEYS = frozenset(['password'])
+
+@lru_cache(maxsize=1)
+def _create_https_context(context_factory):
+    """
+    Create SSL context for HTTPS connections using given factory, in the same way as http.client does it
+    when no context is specified.
+    """
+    context = context_factory()
+    # send ALPN extension to indicate HTTP/1.1 protocol, and enable PHA for TLS 1.3 (like http.client)
+    if ssl.HAS_ALPN:
+        context.set_alpn_protocols(['http/1.1'])
+    if getattr(context, 'post_handshake_auth', None) is not None:
+        context.post_handshake_auth = True
+    return context
+
+
+def get_https_context():
+    """
+    Return SSL context to use for HTTPS connections, shared by all clients.
+
+    Sharing the context means the CA certificates are only loaded once, rather than for every HTTPS connection.
+    The context is created via ssl._create_default_https_context (like http.client does it), so platform
+    configuration of certificate verification (e.g. PYTHONHTTPSVERIFY) and overrides of that function are
+    taken into account; a new context is created if that function was replaced.
+    """
+    return _create_https_context(ssl._create_default_https_context)
+
+
+def _http_method(method, with_body=True, body_first=True):
+    """
+    Create Client method to do a http request with the given HTTP method.
+
+    The (optional) trailing slash is added to the url here directly, and the parameters are urlencoded
+    via Client.urlencode, before handing over to Client.request.
+
+    @param method: HTTP method (e.g. 'GET')
+    @param with_body: whether the request has a body (sent as JSON)
+    @param body_first: whether body comes before headers in the positional arguments
+    """
+    content_type = 'application/json' if with_body else None
+
+    def full_url(client, url, params):
+        """Return url with slash appended (if desired and needed) and urlencoded parameters."""
+        if client.append_slash and not url.endswith('/'):
+            url += '/'
+        return url + client.urlencode(params)
+
+    if not with_body:
+        def http_method(self, url, headers=None, **params):
+            return self.request(method, full_url(self, url, params), None, headers)
+        args_txt = 'headers and parameters'
+    elif body_first:
+        def http_method(self, url, body=None, headers=None, **params):
+            return self.request(method, full_url(self, url, params), body, headers, content_type=content_type)
+        args_txt = 'body, headers and parameters'
+    else:
+        def http_method(self, url, headers=None, body=None, **params):
+            return self.request(method, full_url(self, url, params), body, headers, content_type=content_type)
+        args_txt = 'headers, body and parameters'
+
+    http_method.__name__ = method.lower()
+    http_method.__qualname__ = f'Client.{method.lower()}'
+    http_method.__doc__ = f"""
+        Do a http {method.lower()} request on the given url with given {args_txt}
+        Parameters is a dictionary that will will be urlencoded
+        """
+    return http_method
 
 
 class Client:
@@ -63,9 +134,17 @@ class Client:
         POST,
         PUT,
     )
+    # names of the methods implementing the HTTP methods (e.g. get), used by RequestBuilder,
+    # together with the HTTP_METHODS they were derived from (again when a subclass is defined)
+    _HTTP_METHODS_LOWER = (HTTP_METHODS, frozenset(method.lower() for method in HTTP_METHODS))
 
     USER_AGENT = 'vsc-rest-client'
 
+    def __init_subclass__(cls, **kwargs):
+        """Derive names of the methods implementing the HTTP methods from HTTP_METHODS."""
+        super().__init_subclass__(**kwargs)
+        cls._HTTP_METHODS_LOWER = (cls.HTTP_METHODS, frozenset(method.lower() for method in cls.HTTP_METHODS))
+
     def __init__(self, url, username=None, password=None, token=None, token_type='Token', user_agent=None,
                  append_slash=False, decode=True):
         """
@@ -88,7 +167,7 @@ class Client:
         else:
             self.user_agent = user_agent
 
-        handler = HTTPSHandler()
+        handler = HTTPSHandler(context=get_https_context())
         self.opener = build_opener(handler)
 
         if username is not None:
@@ -102,59 +181,12 @@ class Client:
         elif token is not None:
             self.auth_header = f'{token_type} {token}'
 
-    def _append_slash_to(self, url):
-        """Append slash to specified URL, if desired and needed."""
-        if self.append_slash and not url.endswith('/'):
-            url += '/'
-        return url
-
-    def get(self, url, headers=None, **params):
-        """
-        Do a http get request on the given url with given headers and parameters
-        Parameters is a dictionary that will will be urlencoded
-        """
-        url = self._append_slash_to(url) + self.urlencode(params)
-        return self.request(self.GET, url, None, headers)
-
-    def head(self, url, headers=None, **params):
-        """
-        Do a http head request on the given url with given headers and parameters
-        Parameters is a dictionary that will will be urlencoded
-        """
-        url = self._append_slash_to(url) + self.urlencode(params)
-        return self.request(self.HEAD, url, None, headers)
-
-    def delete(self, url, headers=None, body=None, **params):
-        """
-        Do a http delete request on the given url with given headers, body and parameters
-        Parameters is a dictionary that will will be urlencoded
-        """
-        url = self._append_slash_to(url) + self.urlencode(params)
-        return self.request(self.DELETE, url, body, headers, content_type='application/json')
-
-    def post(self, url, body=None, headers=None, **params):
-        """
-        Do a http post request on the given url with given body, headers and parameters
-        Parameters is a dictionary that will will be urlencoded
-        """
-        url = self._append_slash_to(url) + self.urlencode(params)
-        return self.request(self.POST, url, body, headers, content_type='application/json')
-
-    def put(self, url, body=None, headers=None, **params):
-        """
-        Do a http put request on the given url with given body, headers and parameters
-        Parameters is a dictionary that will will be urlencoded
-        """
-        url = self._append_slash_to(url) + self.urlencode(params)
-        return self.request(self.PUT, url, body, headers, content_type='application/json')
-
-    def patch(self, url, body=None, headers=None, **params):
-        """
-        Do a http patch request on the given url with given body, headers and parameters
-        Parameters is a dictionary that will will be urlencoded
-        """
-        url = self._append_slash_to(url) + self.urlencode(params)
-        return self.request(self.PATCH, url, body, headers, content_type='application/json')
+    get = _http_method(GET, with_body=False)
+    head = _http_method(HEAD, with_body=False)
+    delete = _http_method(DELETE, body_first=False)
+    post = _http_method(POST)
+    put = _http_method(PUT)
+    patch = _http_method(PATCH)
 
     def request(self, method, url, body, headers, content_type=None):
         """Low-level networking. All HTTP-method methods call this"""
@@ -169,39 +201,41 @@ class Client:
             headers['Authorization'] = self.auth_header
         headers['User-Agent'] = self.user_agent
 
-        # censor contents of 'Authorization' part of header, to avoid leaking tokens or passwords in logs
-        secret_items = ['Authorization', 'X-Auth-Token']
-        headers_censored = self.censor_request(secret_items, headers)
+        # censoring is only needed to log the request, so skip it if the debug message would be discarded anyway
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            # censor contents of 'Authorization' part of header, to avoid leaking tokens or passwords in logs
+            headers_censored = self.censor_request(SECRET_HEADERS, headers)
 
-        body_censored = body
-        if body is not None:
+            body_censored = body
             if isinstance(body, str):
                 # assume serialized bodies are already clear of secrets
                 logging.debug("Request with pre-serialized body, will not censor secrets")
-            else:
+            elif body is not None:
                 # censor contents of body to avoid leaking passwords
-                secret_items = ['password']
-                body_censored = self.censor_request(secret_items, body)
-                # serialize body in all cases
-                body = json.dumps(body)
+                body_censored = self.censor_request(SECRET_BODY_KEYS, body)
+
+            logging.debug('cli request: %s, %s, %s, %s', method, url, body_censored, headers_censored)
 
-        logging.debug('cli request: %s, %s, %s, %s', method, url, body_censored, headers_censored)
+        if body is not None and not isinstance(body, str):
+            # serialize body in all cases
+            body = json.dumps(body)
 
         with self.get_connection(method, url, body, headers) as conn:
             status = conn.code
             if method == self.HEAD:
                 pybody = conn.headers
             else:
-                body = conn.read()
-                body = body.decode('utf-8')  # byte encoded response
+                body = conn.read()  # byte encoded response
                 if self.decode:
+                    # json.loads can handle the bytes directly, no need to decode them first
                     try:
                         pybody = json.loads(body)
                     except ValueError:
-                        pybody = body
+                        pybody = body.decode('utf-8')
                 else:
-                    pybody = body
-            logging.debug('reponse len: %s ', len(pybody))
+                    pybody = body.decode('utf-8')
+            # decoded JSON response may also be a number, or null
+            logging.debug('reponse len: %s ', len(pybody) if hasattr(pybody, '__len__') else None)
             return status, pybody
 
     @staticmethod
@@ -209,15 +243,20 @@ class Client:
         """
         Replace secrets in payload with a censored message
 
-        @type secrets: list of keys that will be censored
+        @type secrets: collection of keys that will be censored (preferably a (frozen)set)
         @type payload: dictionary with headers or body of request
         """
-        payload_censored = copy.deepcopy(payload)
+        # only top-level keys get replaced (not modified in place), so a shallow copy is sufficient
+        if isinstance(payload, dict):
+            payload_censored = dict(payload)
+        else:
+            payload_censored = copy.copy(payload)
 
         try:
-            for secret in set(payload_censored).intersection(secrets):
+            # intersect with keys view, avoids creating a set with all keys of the payload
+            for secret in payload_censored.keys() & secrets:
                 payload_censored[secret] = CENSORED_MESSAGE
-        except TypeError:
+        except (AttributeError, TypeError):
             # Unknown payload structure, cannot censor secrets
             pass
 
@@ -232,10 +271,8 @@ class Client:
         if not username:
             username = self.username
 
-        credentials = f'{username}:{password}'
-        credentials = credentials.encode('utf-8')
-        encoded_credentials = base64.b64encode(credentials).strip()
-        encoded_credentials = str(encoded_credentials, 'utf-8')
+        # base64 encoded data never contains whitespace, and only consists of ASCII characters
+        encoded_credentials = base64.b64encode(f'{username}:{password}'.encode('utf-8')).decode('ascii')
 
         return 'Basic ' + encoded_credentials
 
@@ -246,15 +283,26 @@ class Client:
             sep = ''
         if body is not None:
             body = body.encode()
-        request = Request(self.url + sep + url, data=body)
-        for header, value in headers.items():
-            request.add_header(header, value)
-        request.get_method = lambda: method
+        request = Request(self.url + sep + url, data=body, headers=headers, method=method)
         logging.debug('opening request:  %s%s%s', self.url, sep, url)
         connection = self.opener.open(request)
         return connection
 
 
+def _http_method_names(client):
+    """
+    Return names of the methods of the given client implementing the HTTP methods in its HTTP_METHODS.
+
+    Use the names precomputed by Client if they are still in sync with HTTP_METHODS,
+    derive them otherwise (e.g. if HTTP_METHODS was redefined, or for clients not derived from Client).
+    """
+    http_methods = client.HTTP_METHODS
+    cached = getattr(client, '_HTTP_METHODS_LOWER', None)
+    if cached is not None and cached[0] is http_methods:
+        return cached[1]
+    return frozenset(method.lower() for method in http_methods)
+
+
 class RequestBuilder:
     '''RequestBuilder(client).path.to.resource.method(...)
         stands for
@@ -270,7 +318,21 @@ class RequestBuilder:
     def __init__(self, client):
         """Constructor"""
         self.client = client
-        self.url = ''
+        # url segments (each with a leading slash), only joined into the url when needed
+        self._url_parts = []
+        self._url = ''
+
+    @property
+    def url(self):
+        """Request url, built from the path that was traversed so far"""
+        if self._url is None:
+            self._url = ''.join(self._url_parts)
+        return self._url
+
+    @url.setter
+    def url(self, value):
+        self._url_parts = [value]
+        self._url = value
 
     def __getattr__(self, key):
         """
@@ -280,14 +342,15 @@ class RequestBuilder:
         """
         # make sure key is a string
         key = str(key)
-        # our methods are lowercase, but our HTTP_METHOD constants are upercase, so check if it is in there, but only
-        # if it was a lowercase key
+        # our methods are lowercase, but our HTTP_METHOD constants are upercase, so only a lowercase key
+        # matching one of the HTTP methods is considered a method call
         # this is here so bla.something.get() should work, and not result in bla/something/get being returned
-        if key.upper() in self.client.HTTP_METHODS and [x for x in key if x.islower()]:
+        if key in _http_method_names(self.client):
             mfun = getattr(self.client, key)
             fun = partial(mfun, url=self.url)
             return fun
-        self.url += '/' + key
+        self._url_parts.append('/' + key)
+        self._url = None
         return self
 
     __getitem__ = __getattr__
@@ -32,9 +32,9 @@ Tests for the vsc.utils.missing module.
 import sys
 from random import randint, seed
 
-from vsc.utils.missing import get_class_for, get_subclasses, get_subclasses_dict
-from vsc.utils.missing import nub, topological_sort, FrozenDictKnownKeys, TryOrFail
-from vsc.utils.missing import namedtuple_with_defaults
+from vsc.utils.missing import find_sublist_index, get_class_for, get_subclasses, get_subclasses_dict
+from vsc.utils.missing import nub, nub_by, topological_sort, FrozenDictKnownKeys, TryOrFail
+from vsc.utils.missing import namedtuple_with_defaults, Monoid, MonoidDict, RUDict
 from vsc.utils.patterns import Singleton
 from vsc.install.testing import TestCase
 
@@ -171,6 +171,75 @@ class TestMissing(TestCase):
             for (x, y) in [(x_, y_) for x_ in lst for y_ in lst]:
                 self.assertTrue((lst.index(x) <= lst.index(y)) == (nubbed.index(x) <= nubbed.index(y)))
 
+    def test_nub_by(self):
+        """Test nub_by with a predicate and with a key function."""
+        lst = ['a', 'B', 'b', 'A', 'c', 'a']
+        expected = ['a', 'B', 'c']
+        self.assertEqual(nub_by(lst, lambda x, y: x.lower() == y.lower()), expected)
+        self.assertEqual(nub_by(lst, key=str.lower), expected)
+        self.assertEqual(nub_by([], key=str.lower), [])
+        self.assertEqual(nub_by(list(range(10)), key=lambda x: x % 3), [0, 1, 2])
+        self.assertErrorRegex(TypeError, 'predicate or a key', nub_by, lst)
+        self.assertErrorRegex(TypeError, 'not both', nub_by, lst, lambda x, y: x == y, key=str.lower)
+
+    def test_find_sublist_index(self):
+        """Test find_sublist_index for byte-sized integers and for other elements."""
+        self.assertEqual(find_sublist_index([1, 2, 3, 1, 2, 4], [1, 2, 4]), 3)
+        self.assertEqual(find_sublist_index([1, 2, 3], [2, 4]), None)
+        self.assertEqual(find_sublist_index([1, 256, 1, 256, 3], [256, 3]), 3)
+        # (misaligned) partial matches of the packed integers must not count
+        self.assertEqual(find_sublist_index([256, 1], [1]), 1)
+        self.assertEqual(find_sublist_index([-1, 2 ** 40, 2 ** 63 - 1], [2 ** 40, 2 ** 63 - 1]), 1)
+        self.assertEqual(find_sublist_index([2 ** 64, 1, 2 ** 64], [1, 2 ** 64]), 1)
+        self.assertEqual(find_sublist_index(['a', 'a', 'b', 'a', 'a', 'a', 'c'], ['a', 'a', 'c']), 4)
+        self.assertEqual(find_sublist_index(['a', 'b'], ['b', 'c']), None)
+        self.assertEqual(find_sublist_index([0.0, 1.0, 2.0], [1, 2]), 1)
+        self.assertEqual(find_sublist_index(['a'], []), 0)
+        self.assertEqual(find_sublist_index([], []), None)
+        self.assertEqual(find_sublist_index([], ['a']), None)
+
+    def test_monoid(self):
+        """Test folding with Monoid and combining values in MonoidDict."""
+        sum_monoid = Monoid(0, lambda x, y: x + y)
+        self.assertEqual(sum_monoid.fold([]), 0)
+        self.assertEqual(sum_monoid.fold(range(5)), 10)
+        self.assertEqual(sum_monoid(1, 2, 3), 6)
+
+        list_monoid = Monoid([], lambda x, y: x + y)
+        self.assertEqual(list_monoid.fold(iter([[1], [2, 3], [4]])), [1, 2, 3, 4])
+
+        md = MonoidDict(list_monoid)
+        self.assertEqual(md['foo'], [])
+        md['foo'] = [1]
+        md['foo'] = [2]
+        md['bar'] = [3]
+        self.assertEqual(md, {'foo': [1, 2], 'bar': [3]})
+
+    def test_rudict(self):
+        """Test recursive updating of RUDict, incl. subtrees shared by reference."""
+        shared = {'foo': 1, 'bar': {'baz': 2}}
+        new = {'foo': 3, 'bar': {'qux': 4}}
+        rud = RUDict({'one': shared, 'two': shared, 'three': {'foo': 0}, 'lst': [1]})
+        rud.update({'one': new, 'two': new, 'three': new, 'lst': [2], 'four': 5})
+
+        self.assertEqual(rud, {
+            'one': {'foo': 3, 'bar': {'baz': 2, 'qux': 4}},
+            'two': {'foo': 3, 'bar': {'baz': 2, 'qux': 4}},
+            'three': {'foo': 3, 'bar': {'qux': 4}},
+            'lst': [1, 2],
+            'four': 5,
+        })
+        # shared subtrees remain shared, original dicts are not modified
+        self.assertTrue(rud['one'] is rud['two'])
+        self.assertEqual(shared, {'foo': 1, 'bar': {'baz': 2}})
+
+        rud = RUDict({'foo': {'bar': 1}})
+        rud.update(foo={'baz': 2})
+        self.assertEqual(rud, {'foo': {'bar': 1, 'baz': 2}})
+
+        # same signature as dict.update
+        self.assertErrorRegex(TypeError, '', rud.update, {'foo': 2}, {'bar': 3})
+
     def test_tryorfail_no_sleep(self):
         """test for a retry that succeeds."""
 
@@ -322,6 +391,12 @@ class TestMissing(TestCase):
         expected = sorted([T1, T12, T123, T13], key=cname)
         self.assertEqual(sorted(get_subclasses(T1, include_base_class=True), key=cname), expected)
 
+        # classes reachable via multiple paths are only included once
+        class T1213(T12, T13):
+            pass
+        self.assertEqual(get_subclasses(T1), [T12, T123, T1213, T13])
+        self.assertEqual(get_subclasses(T1, include_base_class=True), [T1, T12, T123, T1213, T13])
+
     def test_namedtuple_with_defaults(self):
 
         fields = ["field1", "field2", "field3"]
@@ -28,11 +28,14 @@ Unit tests for the rest client.
 
 @author: Jens Timmerman (Ghent University)
 """
+import json
+import logging
 import os
+import ssl
 
 from vsc.install.testing import TestCase
-from vsc.utils.rest import Client, RestClient
-from urllib.request import HTTPError
+from vsc.utils.rest import Client, RequestBuilder, RestClient, get_https_context
+from urllib.request import HTTPError, ProxyHandler
 
 # the user who's repo to test
 GITHUB_USER = "hpcugent"
@@ -46,6 +49,38 @@ GITHUB_TOKEN = os.environ.get('VSC_GITHUB_TOKEN', None)
 GITHUB_BRANCH = 'master'
 
 
+class FakeConnection:
+    """Fake connection returned by FakeClient.get_connection, serving a fixed response"""
+
+    def __init__(self, body):
+        self.code = 200
+        self.headers = {'Content-Type': 'application/json'}
+        self.body = body
+
+    def read(self):
+        return self.body
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+class FakeClient(Client):
+    """Client that does not do any actual requests, but records the arguments passed to get_connection"""
+
+    RESPONSE = b'{"login": "hpcugent", "id": 1515263}'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.connections = []
+
+    def get_connection(self, method, url, body, headers):
+        self.connections.append((method, url, body, headers))
+        return FakeConnection(self.RESPONSE)
+
+
 class RestClientTest(TestCase):
     """ small test for The RestClient
     This should not be to much, since there is an hourly limit of requests for the github api
@@ -112,6 +147,175 @@ class RestClientTest(TestCase):
         except HTTPError:
             pass
 
+    def test_request_builder(self):
+        """Test building request urls, without doing any request"""
+        fun = self.client.repos[GITHUB_USER][GITHUB_REPO].issues[1].get
+        self.assertEqual(fun.func, self.client.client.get)
+        self.assertEqual(fun.keywords, {'url': '/repos/hpcugent/testrepository/issues/1'})
+
+        # only lowercase method names result in a request, anything else is part of the url
+        builder = self.client.some.GET.Post
+        self.assertEqual(builder.url, '/some/GET/Post')
+        fun = builder.post
+        self.assertEqual(fun.func, self.client.client.post)
+        self.assertEqual(fun.keywords, {'url': '/some/GET/Post'})
+
+        # subclasses can support additional HTTP methods
+        class OptionsClient(Client):
+            """Client that also supports the OPTIONS HTTP method"""
+            OPTIONS = 'OPTIONS'
+            HTTP_METHODS = Client.HTTP_METHODS + (OPTIONS,)
+
+            def options(self, url, headers=None, **params):
+                return self.request(self.OPTIONS, url, None, headers)
+
+        client = OptionsClient('https://api.github.com')
+        fun = RequestBuilder(client).some.path.options
+        self.assertEqual(fun.func, client.options)
+        self.assertEqual(fun.keywords, {'url': '/some/path'})
+        fun = RequestBuilder(client).some.path.get
+        self.assertEqual(fun.func, client.get)
+        self.assertEqual(RequestBuilder(self.client.client).some.path.options.url, '/some/path/options')
+
+        # HTTP methods redefined after class creation, and clients not derived from Client are supported too
+        client = Client('https://api.github.com')
+        client.HTTP_METHODS = (Client.GET,)
+        self.assertEqual(RequestBuilder(client).some.path.get.keywords, {'url': '/some/path'})
+        self.assertEqual(RequestBuilder(client).some.path.post.url, '/some/path/post')
+
+        class OtherClient:
+            """Minimal client, not derived from Client"""
+            HTTP_METHODS = ('GET',)
+
+            def get(self, url):
+                return url
+
+        fun = RequestBuilder(OtherClient()).some.path.get
+        self.assertEqual(fun(), '/some/path')
+
+    def test_request(self):
+        """Test Client.request, without doing any actual request"""
+        logger = logging.getLogger()
+        self.addCleanup(logger.setLevel, logger.level)
+        for level in (logging.INFO, logging.DEBUG):
+            logger.setLevel(level)
+            client = FakeClient('https://api.github.com', username='vsc10001', password='potato')
+
+            status, body = client.post('user', body={'password': 'potato'}, foo='bar')
+            self.assertEqual((status, body), (200, {'login': 'hpcugent', 'id': 1515263}))
+            method, url, body, headers = client.connections[-1]
+            self.assertEqual((method, url), (Client.POST, 'user?foo=bar'))
+            # body is serialized, secrets are only censored in the logs
+            self.assertEqual(json.loads(body), {'password': 'potato'})
+            self.assertEqual(headers['Authorization'], client.hash_pass('potato'))
+            self.assertEqual(headers['Content-Type'], 'application/json')
+
+            status, body = client.put('user', body='{"foo": "bar"}')
+            self.assertEqual(status, 200)
+            self.assertEqual(client.connections[-1][2], '{"foo": "bar"}')
+
+            status, headers = client.head('user')
+            self.assertEqual((status, headers), (200, {'Content-Type': 'application/json'}))
+            self.assertEqual(client.connections[-1][:3], (Client.HEAD, 'user', None))
+
+            # responses that are not JSON (or not a JSON object) are handled too
+            for response, expected in [(b'not json', 'not json'), (b'42', 42), (b'null', None)]:
+                client.RESPONSE = response
+                self.assertEqual(client.get('user'), (200, expected))
+
+            client = FakeClient('https://api.github.com', decode=False)
+            status, body = client.get('user')
+            self.assertEqual((status, body), (200, FakeClient.RESPONSE.decode('utf-8')))
+
+    def test_http_methods(self):
+        """Test arguments of the methods for each of the HTTP methods, without doing any actual request"""
+        client = FakeClient('https://api.github.com', append_slash=True)
+
+        client.get('user', {'X-Foo': 'bar'}, foo='bar')
+        self.assertEqual(client.connections[-1][:3], (Client.GET, 'user/?foo=bar', None))
+        self.assertEqual(client.connections[-1][3]['X-Foo'], 'bar')
+        client.head('user/')
+        self.assertEqual(client.connections[-1][:3], (Client.HEAD, 'user/', None))
+
+        # headers come before body for delete
+        client.delete('user', {'X-Foo': 'bar'}, {'foo': 'bar'})
+        self.assertEqual(client.connections[-1][:3], (Client.DELETE, 'user/', '{"foo": "bar"}'))
+        self.assertEqual(client.connections[-1][3]['X-Foo'], 'bar')
+
+        for method in (Client.POST, Client.PUT, Client.PATCH):
+            getattr(client, method.lower())('user', {'foo': 'bar'}, {'X-Foo': 'bar'}, foo='bar', baz=1)
+            self.assertEqual(client.connections[-1][:3], (method, 'user/?foo=bar&baz=1', '{"foo": "bar"}'))
+            self.assertEqual(client.connections[-1][3]['X-Foo'], 'bar')
+            self.assertEqual(client.connections[-1][3]['Content-Type'], 'application/json')
+
+        # subclasses can customize how parameters are encoded
+        class SortedParamsClient(FakeClient):
+            """Client that passes parameters in sorted order"""
+            def urlencode(self, params):
+                return super().urlencode(sorted(params.items()))
+
+        client = SortedParamsClient('https://api.github.com')
+        client.get('user', foo='bar', baz=1)
+        self.assertEqual(client.connections[-1][1], 'user?baz=1&foo=bar')
+
+    def test_https_context(self):
+        """Test that all clients share the same SSL context, but have their own opener"""
+        self.assertTrue(get_https_context() is get_https_context())
+        self.assertEqual(get_https_context().verify_mode, ssl.CERT_REQUIRED)
+
+        # overriding the default HTTPS context factory (e.g. to disable certificate verification) is honored
+        orig_context_factory = ssl._create_default_https_context
+        self.addCleanup(setattr, ssl, '_create_default_https_context', orig_context_factory)
+        created_contexts = []
+
+        def unverified_context_factory():
+            """Create (and keep track of) unverified SSL context"""
+            context = ssl._create_unverified_context()
+            created_contexts.append(context)
+            return context
+
+        ssl._create_default_https_context = unverified_context_factory
+        Client('https://api.github.com')
+        Client('https://api.github.com')
+        self.assertEqual(len(created_contexts), 1)
+        self.assertTrue(get_https_context() is created_contexts[0])
+        self.assertEqual(get_https_context().verify_mode, ssl.CERT_NONE)
+
+        # proxy settings are picked up by every new client
+        orig_environ = os.environ.copy()
+        self.addCleanup(os.environ.update, orig_environ)
+        self.addCleanup(os.environ.clear)
+        for key in list(os.environ):
+            if key.lower().endswith('_proxy'):
+                del os.environ[key]
+        client = Client('https://api.github.com')
+        self.assertFalse(any(isinstance(h, ProxyHandler) for h in client.opener.handlers))
+        os.environ['https_proxy'] = 'http://proxy.example.com:3128'
+        client = Client('https://api.github.com')
+        self.assertTrue(any(isinstance(h, ProxyHandler) for h in client.opener.handlers))
+        self.assertEqual(len(created_contexts), 1)
+
+    def test_hash_pass(self):
+        """Test basic authentication header"""
+        client = Client('https://api.github.com', username='vsc10001', password='potato')
+        self.assertEqual(client.auth_header, 'Basic dnNjMTAwMDE6cG90YXRv')
+        self.assertEqual(client.hash_pass('pötätö', username='vsc10002'), 'Basic dnNjMTAwMDI6cMO2dMOkdMO2')
+
+    def test_get_connection_request(self):
+        """Test the request opened by Client.get_connection, without actually opening it"""
+        class FakeOpener:
+            """Opener that just returns the request"""
+            def open(self, request):
+                return request
+
+        client = Client('https://api.github.com')
+        client.opener = FakeOpener()
+        request = client.get_connection(Client.PATCH, 'user', body='{"foo": "bar"}', headers={'X-Foo': 'bar'})
+        self.assertEqual(request.get_method(), Client.PATCH)
+        self.assertEqual(request.full_url, 'https://api.github.com/user')
+        self.assertEqual(request.data, b'{"foo": "bar"}')
+        self.assertEqual(request.header_items(), [('X-foo', 'bar')])
+
     def test_censor_request(self):
         """Test censor of requests"""
 
@@ -128,6 +332,9 @@ class RestClientTest(TestCase):
             payload_censored,
             {'username': 'vsc10001', 'password': '<actual secret censored>', 'token': '<actual secret censored>'},
         )
+        # original payload is left untouched
+        self.assertEqual(payload['password'], 'potato')
+        self.assertEqual(payload['token'], '123456')
         payload_censored = client.censor_request(['something_else'], payload)
         self.assertEqual(payload_censored, payload)
 